@@ -1,19 +1,22 @@
 from langchain_google_genai import ChatGoogleGenerativeAI
 from langchain.output_parsers import PydanticOutputParser
 from langchain_core.prompts import PromptTemplate
-from fastapi import FastAPI, Request
+from fastapi import FastAPI, Request, HTTPException
 from fastapi.responses import StreamingResponse
 from fastapi.middleware.cors import CORSMiddleware
 from pydantic import BaseModel, Field
 from dotenv import load_dotenv
 import os
-from typing import List, AsyncGenerator
+from typing import List, AsyncGenerator, Optional
 import asyncio
 from product_rag import get_similar_products, initialize_db, recreate_db
+from neighbors import update_neighbor_table
+from jobs import JobManager, STATUS_CONCLUIDO, STATUS_ERRO
 import time
 import json
 import google.generativeai as genai
 import logging
+import threading
 
 # Configuração de logging
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
@@ -123,6 +126,29 @@ query_template = """
     </target-product>
     """
 
+def build_query(product_list, target_product: str) -> str:
+    # Apenas os nomes dos candidatos, um por linha; os metadados dos documentos não vão para o prompt
+    names = "\n".join(doc.page_content for doc in product_list)
+    return query_template.format(product_list=names, target_product=target_product)
+
+# Se configurado, registra as respostas da API para montar o golden set do evaluate_retrieval.py
+CAPTURE_REQUESTS_FILE = os.getenv("CAPTURE_REQUESTS_FILE")
+capture_lock = threading.Lock()
+
+def capture_request(target_product: str, result):
+    if not CAPTURE_REQUESTS_FILE:
+        return
+    try:
+        record = {
+            "target": target_product,
+            "expected": [found.ItemName for found in result.found_objects],
+            "captured_at": time.time()
+        }
+        with capture_lock, open(CAPTURE_REQUESTS_FILE, "a", encoding="utf-8") as f:
+            f.write(json.dumps(record, ensure_ascii=False) + "\n")
+    except Exception as e:
+        logger.warning(f"Erro ao registrar requisição em {CAPTURE_REQUESTS_FILE}: {str(e)}")
+
 def get_products(target_product: str):
     print("Initiating similar product search...")
     start_time = time.time()
@@ -130,12 +156,13 @@ def get_products(target_product: str):
     end_time = time.time()
     print(f"Product list obtained in {end_time - start_time} seconds.")
 
-    query = query_template.format(product_list=product_list, target_product=target_product)
+    query = build_query(product_list, target_product)
     print("Initiating llm reasoning")
     start_time_2 = time.time()
     result = chain.invoke({"query": query})
     end_time_2 = time.time()
     print(f"LLM reasoning completed in {end_time_2 - start_time_2} seconds.")
+    capture_request(target_product, result)
     return result
 
 async def get_products_streaming(target_product: str) -> AsyncGenerator[str, None]:
@@ -156,7 +183,7 @@ async def get_products_streaming(target_product: str) -> AsyncGenerator[str, Non
     }) + "\n"
     await asyncio.sleep(0.1)
     
-    query = query_template.format(product_list=product_list, target_product=target_product)
+    query = build_query(product_list, target_product)
     
     yield json.dumps({"status": "iniciando_llm", "message": "Iniciando análise de similaridade..."}) + "\n"
     await asyncio.sleep(0.1)
@@ -165,6 +192,7 @@ async def get_products_streaming(target_product: str) -> AsyncGenerator[str, Non
     result = chain.invoke({"query": query})
     end_time_2 = time.time()
     llm_time = end_time_2 - start_time_2
+    capture_request(target_product, result)
     
     yield json.dumps({
         "status": "concluido",
@@ -213,7 +241,7 @@ async def process_products_streaming(target_products: List[str]) -> AsyncGenerat
             }) + "\n"
             await asyncio.sleep(0.1)
             
-            query = query_template.format(product_list=product_list, target_product=target_product)
+            query = build_query(product_list, target_product)
             
             yield json.dumps({
                 "status": "iniciando_llm",
@@ -227,6 +255,7 @@ async def process_products_streaming(target_products: List[str]) -> AsyncGenerat
             result = chain.invoke({"query": query})
             end_time_2 = time.time()
             llm_time = end_time_2 - start_time_2
+            capture_request(target_product, result)
             
             yield json.dumps({
                 "status": "produto_concluido",
@@ -251,6 +280,55 @@ async def process_products_streaming(target_products: List[str]) -> AsyncGenerat
         "message": f"Processamento de todos os {len(target_products)} produtos concluído"
     }) + "\n"
 
+async def stream_job_progress(job_id: str) -> AsyncGenerator[str, None]:
+    job = job_manager.get_job(job_id)
+    yield json.dumps({
+        "status": "iniciando",
+        "job_id": job_id,
+        "message": f"Acompanhando job com {job['total']} produtos"
+    }) + "\n"
+
+    since = 0
+    while True:
+        job = job_manager.get_job(job_id, since=since)
+        since = job["cursor"]
+        for item in job["items"]:
+            if item["status"] == STATUS_CONCLUIDO:
+                yield json.dumps({
+                    "status": "produto_concluido",
+                    "produto_idx": item["produto_idx"],
+                    "produto": item["produto"],
+                    "result": item["result"]
+                }) + "\n"
+            elif item["status"] == STATUS_ERRO:
+                yield json.dumps({
+                    "status": "erro",
+                    "produto_idx": item["produto_idx"],
+                    "produto": item["produto"],
+                    "message": item["error"]
+                }) + "\n"
+
+        if job["status"] == STATUS_CONCLUIDO:
+            break
+        await asyncio.sleep(1)
+
+    yield json.dumps({
+        "status": "todos_concluidos",
+        "job_id": job_id,
+        "message": f"Processamento de todos os {job['total']} produtos concluído"
+    }) + "\n"
+
+# Jobs em lote processados em background e persistidos em SQLite
+job_manager = JobManager(process_func=lambda target_product: get_products(target_product).dict())
+
+@app.on_event("startup")
+def start_job_manager():
+    job_manager.start()
+
+@app.on_event("shutdown")
+def stop_job_manager():
+    job_manager.shutdown()
+
 @app.get("/product/{target_product}")
 def get_product(target_product: str):
     if (target_product is None or target_product == ""):
@@ -310,6 +388,51 @@ async def get_products_post_streaming(request: Request):
         }
     )
 
+@app.post("/jobs")
+async def create_job(request: Request):
+    data = await request.json()
+
+    if isinstance(data, list):
+        target_products = data
+    else:
+        target_products = data.get("target_products", [])
+
+    if not target_products:
+        return {"error": "No target products provided."}
+
+    job_id = job_manager.submit_job(target_products)
+    return {"job_id": job_id, "total": len(target_products)}
+
+@app.get("/jobs/{job_id}")
+def get_job(job_id: str, since: Optional[int] = None):
+    # Com `since`, retorna apenas os itens alterados depois do `cursor` devolvido na consulta anterior
+    job = job_manager.get_job(job_id, since=since)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job não encontrado")
+    return job
+
+@app.post("/jobs/{job_id}/retry")
+def retry_job(job_id: str):
+    count = job_manager.retry_failed(job_id)
+    if count is None:
+        raise HTTPException(status_code=404, detail="Job não encontrado")
+    return {"job_id": job_id, "requeued": count}
+
+@app.get("/jobs/{job_id}/stream")
+async def get_job_streaming(job_id: str):
+    if job_manager.get_job(job_id) is None:
+        raise HTTPException(status_code=404, detail="Job não encontrado")
+
+    return StreamingResponse(
+        stream_job_progress(job_id),
+        media_type="application/x-ndjson",
+        headers={
+            "Cache-Control": "no-cache",
+            "Connection": "keep-alive",
+            "X-Accel-Buffering": "no"
+        }
+    )
+
 @app.get("/health")
 def health_check():
     return {"status": "ok", "message": "API is running"}
@@ -318,7 +441,10 @@ def health_check():
 def admin_recreate_db():
     try:
         recreate_db()
-        return {"status": "success", "message": "Banco de dados recriado com sucesso"}
+        # A tabela de vizinhos é recalculada a partir dos embeddings do banco recriado
+        if not update_neighbor_table():
+            return {"status": "error", "message": "Banco de dados recriado, mas houve falha ao recalcular a tabela de vizinhos"}
+        return {"status": "success", "message": "Banco de dados e tabela de vizinhos recriados com sucesso"}
     except Exception as e:
         return {"status": "error", "message": f"Erro ao recriar banco de dados: {str(e)}"}
 
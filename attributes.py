@@ -0,0 +1,228 @@
+import os
+import re
+import json
+import logging
+from collections import Counter
+import numpy as np
+
+# Configuração de logging
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+# Caminho do índice de atributos (colunar)
+ATTRIBUTES_FILE = os.getenv("ATTRIBUTES_FILE", "./attributes.npz")
+
+# Unidades de medida reconhecidas: unidade -> (unidade base, fator de conversão)
+UNITS = {
+    "MM": ("MM", 1), "CM": ("MM", 10), "M": ("MM", 1000), "MT": ("MM", 1000), "MTS": ("MM", 1000),
+    "ML": ("ML", 1), "L": ("ML", 1000), "LT": ("ML", 1000), "LTS": ("ML", 1000),
+    "MG": ("G", 0.001), "G": ("G", 1), "GR": ("G", 1), "GRS": ("G", 1), "KG": ("G", 1000),
+    "POL": ("POL", 1),
+}
+
+NUMBER = r"(\d+(?:[.,]\d+)?)"
+UNIT = rf"({'|'.join(sorted(UNITS, key=len, reverse=True))})"
+# Unidades em metros: em "12X50M" (fitas, rolos) só o comprimento está em metros, a largura está em MM
+METER_UNITS = {"M", "MT", "MTS"}
+# Até três dimensões (ex.: 30X40CM, 12MMX50M); a unidade de cada dimensão é opcional, exceto a da última
+SIZE_PATTERN = re.compile(
+    rf"(?<![\w/]){NUMBER}\s*(?:{UNIT}\s*(?=X))?(?:X\s*{NUMBER}\s*(?:{UNIT}\s*(?=X))?)?(?:X\s*{NUMBER}\s*)?{UNIT}(?!\w)"
+)
+PACK_PATTERNS = [
+    re.compile(r"(?<!\w)(\d+)\s*(?:UN|UND|UNID|UNIDADES|UNDS|PCS|FLS|FOLHAS)(?!\w)"),
+    re.compile(r"(?<!\w)(?:C/|CX\s*C/|CX|PCT\s*C/|PCT|PC\s*C/|PAC\s*C/|PAC)\s*(\d+)(?!\w)"),
+]
+TOKEN_PATTERN = re.compile(r"\b[A-ZÀ-Ý]{3,}\b")
+STOPWORDS = {"COM", "PARA", "SEM", "DOS", "DAS", "UND", "UNID", "UNIDADES", "UNDS", "PCS", "FLS",
+             "FOLHAS", "PCT", "PAC", "MTS", "LTS", "GRS", "POL"}
+
+def _to_number(value: str) -> float:
+    return float(value.replace(",", "."))
+
+def _format_number(value: float) -> str:
+    return f"{round(value, 3):g}"
+
+def parse_attributes(item_name: str) -> dict:
+    """
+    Extrai os atributos estruturados do nome do produto.
+    Ex.: "INS CANUDO 10MM 100 UN" -> medida 10 MM, 100 unidades, categoria INS.
+    As medidas são convertidas para a unidade base (MM, ML, G) para permitir comparação direta.
+    """
+    name = " ".join(str(item_name).upper().split())
+    attributes = {"size_dims": "", "size_unit": "", "pack_qty": 0, "category": "", "tokens": ""}
+
+    size = SIZE_PATTERN.search(name)
+    if size:
+        n1, u1, n2, u2, n3, unit = size.groups()
+        base_unit = UNITS[unit][0]
+        dims = []
+        values = [(value, dim_unit) for value, dim_unit in [(n1, u1), (n2, u2), (n3, None)] if value]
+        for i, (value, dim_unit) in enumerate(values):
+            is_last = i == len(values) - 1
+            if is_last:
+                dim_unit = unit
+            elif not dim_unit or UNITS[dim_unit][0] != base_unit:
+                # Dimensões sem unidade própria usam a unidade final, exceto metros (WIDTHxLENGTH M)
+                dim_unit = "MM" if unit in METER_UNITS else unit
+            dims.append(_to_number(value) * UNITS[dim_unit][1])
+        attributes["size_dims"] = "X".join(_format_number(value) for value in dims)
+        attributes["size_unit"] = base_unit
+
+    for pattern in PACK_PATTERNS:
+        pack = pattern.search(name)
+        if pack:
+            attributes["pack_qty"] = int(pack.group(1))
+            break
+
+    tokens = [token for token in TOKEN_PATTERN.findall(name) if token not in STOPWORDS and token not in UNITS]
+    if tokens:
+        attributes["category"] = tokens[0]
+        attributes["tokens"] = " ".join(tokens)
+
+    return attributes
+
+def attribute_metadata(attributes: dict) -> dict:
+    """Metadados para o banco vetorial (o Chroma não aceita valores vazios)"""
+    return {key: value for key, value in attributes.items() if key != "tokens" and value}
+
+def compare_sizes(target_dims: str, candidate_dims: str) -> int:
+    """
+    Compara as medidas (já na mesma unidade base) do produto alvo e de um candidato:
+    2 = iguais; 1 = as medidas do alvo estão contidas nas do candidato (ex.: 6 e 6X210);
+    0 = não comparáveis (números de dimensões diferentes); -1 = mesmas dimensões com valores diferentes.
+    """
+    target = target_dims.split("X")
+    candidate = candidate_dims.split("X")
+    if target == candidate:
+        return 2
+    if len(target) == len(candidate):
+        return 1 if Counter(target) == Counter(candidate) else -1
+    if not Counter(target) - Counter(candidate):
+        return 1
+    return 0
+
+def attribute_filter(attributes: dict):
+    """Filtro do Chroma para restringir a busca vetorial a itens com a mesma medida, ou None"""
+    if not attributes["size_dims"]:
+        return None
+    return {"$and": [
+        {"size_unit": {"$eq": attributes["size_unit"]}},
+        {"size_dims": {"$eq": attributes["size_dims"]}},
+    ]}
+
+class AttributeIndex:
+    """Índice colunar com os atributos de todos os itens do catálogo"""
+
+    COLUMNS = ["size_dims", "size_unit", "category", "tokens"]
+
+    def __init__(self, names, columns):
+        self.names = names
+        self.columns = columns
+        self.index = {str(name): i for i, name in enumerate(names)}
+
+    @classmethod
+    def build(cls, item_names):
+        parsed = [parse_attributes(name) for name in item_names]
+        columns = {column: np.asarray([p[column] for p in parsed], dtype=str) for column in cls.COLUMNS}
+        columns["pack_qty"] = np.asarray([p["pack_qty"] for p in parsed], dtype=np.int32)
+        return cls(np.asarray(item_names, dtype=str), columns)
+
+    def save(self, path=ATTRIBUTES_FILE):
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, "wb") as f:
+            np.savez(f, names=self.names, **self.columns)
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path=ATTRIBUTES_FILE):
+        with np.load(path, allow_pickle=False) as data:
+            names = data["names"]
+            columns = {column: data[column] for column in cls.COLUMNS + ["pack_qty"]}
+        return cls(names, columns)
+
+    def rows(self, item_names):
+        """Linhas dos itens no índice; itens ausentes são analisados na hora e acrescentados ao resultado"""
+        rows = [self.index.get(name, -1) for name in item_names]
+        missing = [name for name, row in zip(item_names, rows) if row < 0]
+        if not missing:
+            return {column: values[rows] for column, values in self.columns.items()}
+
+        extra = AttributeIndex.build(missing)
+        offset = len(self.names)
+        extra_rows = iter(range(offset, offset + len(missing)))
+        rows = [row if row >= 0 else next(extra_rows) for row in rows]
+        return {
+            column: np.concatenate([values, extra.columns[column]])[rows]
+            for column, values in self.columns.items()
+        }
+
+def build_attribute_index(products_file, path=ATTRIBUTES_FILE):
+    """Etapa de ingestão: extrai os atributos de todos os itens do catálogo e salva o índice colunar"""
+    with open(products_file, "r", encoding="utf-8") as f:
+        item_names = [product["ItemName"] for product in json.load(f)["products"]]
+
+    index = AttributeIndex.build(item_names)
+    index.save(path)
+    logger.info(f"Índice de atributos salvo em {path} ({len(item_names)} itens)")
+    return index
+
+_index = None
+_index_mtime = None
+
+def get_attribute_index():
+    """Retorna o índice de atributos carregado, recarregando se o arquivo foi reconstruído"""
+    global _index, _index_mtime
+
+    if not os.path.exists(ATTRIBUTES_FILE):
+        return AttributeIndex.build([])
+
+    mtime = os.path.getmtime(ATTRIBUTES_FILE)
+    if _index is None or mtime != _index_mtime:
+        try:
+            _index = AttributeIndex.load(ATTRIBUTES_FILE)
+            _index_mtime = mtime
+        except Exception as e:
+            logger.error(f"Erro ao carregar índice de atributos: {str(e)}")
+            return AttributeIndex.build([])
+    return _index
+
+def rank_candidates(target_attributes: dict, item_names, max_candidates, min_candidates=10):
+    """
+    Reordena os candidatos da busca vetorial usando os atributos estruturados.
+    Itens com medida comprovadamente diferente (mesma unidade e mesmo número de dimensões) são descartados,
+    a menos que sobrem poucos candidatos; medidas escritas de outra forma só perdem pontos.
+    Itens com a mesma medida, quantidade por embalagem ou categoria sobem na lista.
+    Retorna as posições dos candidatos selecionados, em ordem.
+    """
+    if not item_names:
+        return []
+
+    columns = get_attribute_index().rows(list(item_names))
+    positions = np.arange(len(item_names))
+
+    score = np.zeros(len(item_names), dtype=np.int32)
+    conflict = np.zeros(len(item_names), dtype=bool)
+    if target_attributes["size_dims"]:
+        same_unit = columns["size_unit"] == target_attributes["size_unit"]
+        comparison = np.array([
+            compare_sizes(target_attributes["size_dims"], dims) if unit_matches else 0
+            for dims, unit_matches in zip(columns["size_dims"], same_unit)
+        ], dtype=np.int32)
+        conflict = comparison < 0
+        # 2 pontos para a mesma medida, 1 para medida contida; medidas de mesma unidade não comparáveis perdem 1
+        score += np.where(comparison > 0, comparison, 0) - (same_unit & (comparison == 0))
+    if target_attributes["pack_qty"]:
+        score += columns["pack_qty"] == target_attributes["pack_qty"]
+    if target_attributes["category"]:
+        score += columns["category"] == target_attributes["category"]
+
+    # Só descarta os conflitos se restarem candidatos suficientes para o LLM
+    if (~conflict).sum() >= min(min_candidates, len(item_names)):
+        positions = positions[~conflict]
+        score = score[~conflict]
+    else:
+        score = score - 10 * conflict
+
+    # Ordenação estável: mantém a ordem da busca vetorial entre itens de mesma pontuação
+    order = np.argsort(-score, kind="stable")
+    return positions[order][:max_candidates].tolist()
@@ -0,0 +1,252 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Avalia a qualidade e a latência da busca de candidatos usando um golden set.
+
+O golden set é um arquivo JSONL com um produto alvo e os ItemNames corretos por linha:
+    {"target": "CANUDO 10MM C/100", "expected": ["INS CANUDO 10MM 100 UN"]}
+Ele pode ser capturado do tráfego real configurando CAPTURE_REQUESTS_FILE na API
+(as respostas do LLM devem ser revisadas antes de usar o arquivo como golden set).
+
+Exemplo:
+    python evaluate_retrieval.py --golden golden_set.jsonl --k 50 100 300 --attributes both
+    python evaluate_retrieval.py --hnsw 16:100:10 --hnsw 32:200:100
+
+Os embeddings dos produtos alvo são calculados antes das medições: a latência da busca não inclui
+a chamada de embedding, que é reportada em colunas próprias (emb p50/p95). Com --include-embedding,
+o tempo de embedding é somado à latência das buscas que precisaram dele.
+"""
+
+import argparse
+import itertools
+import json
+import logging
+import sys
+import time
+import numpy as np
+import product_rag
+from neighbors import normalize_name, NEIGHBORS_TOP_N
+
+# Configuração de logging
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+logger = logging.getLogger("evaluate_retrieval")
+
+GOLDEN_FILE = "golden_set.jsonl"
+
+# Tamanho dos lotes ao copiar o banco vetorial para os índices HNSW de teste
+COPY_BATCH_SIZE = 5000
+
+class CachedEmbeddings:
+    """
+    Guarda os embeddings das consultas para que a latência medida seja apenas a da busca.
+    O tempo da primeira chamada de cada consulta fica em `latencies` (ms), e `used` indica
+    se a busca pediu algum embedding desde que foi zerado.
+    """
+
+    def __init__(self, embeddings):
+        self.embeddings = embeddings
+        self.cache = {}
+        self.latencies = {}
+        self.used = False
+
+    def embed_query(self, text):
+        if text not in self.cache:
+            start_time = time.perf_counter()
+            self.cache[text] = self.embeddings.embed_query(text)
+            self.latencies[text] = (time.perf_counter() - start_time) * 1000
+        self.used = True
+        return self.cache[text]
+
+    def embed_documents(self, texts):
+        return self.embeddings.embed_documents(texts)
+
+def load_golden_set(path, limit=None):
+    """Lê o golden set, ignorando linhas sem produto alvo ou sem itens esperados"""
+    examples = []
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            if not line.strip():
+                continue
+            record = json.loads(line)
+            expected = record.get("expected") or []
+            if isinstance(expected, str):
+                expected = [expected]
+            if record.get("target") and expected:
+                examples.append({"target": record["target"], "expected": {normalize_name(name) for name in expected}})
+    return examples[:limit] if limit else examples
+
+def build_hnsw_index(M, construction_ef, search_ef):
+    """
+    Cria uma cópia em memória do banco vetorial com outros parâmetros HNSW,
+    reaproveitando os embeddings armazenados (sem novas chamadas de embedding)
+    """
+    import chromadb
+    from langchain_chroma import Chroma
+
+    data = product_rag.vectordb.get(include=["documents", "embeddings", "metadatas"])
+    metadata = dict(product_rag.vectordb._collection.metadata or {})
+    metadata.update({"hnsw:M": M, "hnsw:construction_ef": construction_ef, "hnsw:search_ef": search_ef})
+
+    client = chromadb.EphemeralClient()
+    name = f"eval_hnsw_{M}_{construction_ef}_{search_ef}"
+    collection = client.get_or_create_collection(name, metadata=metadata)
+    for start in range(0, len(data["ids"]), COPY_BATCH_SIZE):
+        end = start + COPY_BATCH_SIZE
+        collection.add(
+            ids=data["ids"][start:end],
+            embeddings=data["embeddings"][start:end],
+            documents=data["documents"][start:end],
+            metadatas=data["metadatas"][start:end],
+        )
+
+    return Chroma(client=client, collection_name=name, embedding_function=product_rag.embedding_function)
+
+def evaluate(examples, setting, include_embedding=False):
+    """
+    Executa o golden set com uma configuração de busca e calcula as métricas.
+    Com `include_embedding`, o tempo de embedding do produto alvo é somado à latência
+    das buscas que precisaram dele (as atendidas pela tabela de vizinhos não precisam).
+    """
+    embeddings = getattr(product_rag, "embedding_function", None)
+    cached = isinstance(embeddings, CachedEmbeddings)
+    ranks = []
+    sizes = []
+    latencies = []
+    embedding_latencies = []
+    for example in examples:
+        if cached:
+            embeddings.used = False
+        start_time = time.perf_counter()
+        docs = product_rag.get_similar_products(
+            example["target"],
+            k=setting["k"],
+            max_candidates=setting["max_candidates"],
+            use_attributes=setting["attributes"],
+            use_neighbors=setting["neighbors"],
+        )
+        latency = (time.perf_counter() - start_time) * 1000
+        embedding_latency = embeddings.latencies.get(example["target"], 0.0) if cached and embeddings.used else 0.0
+        latencies.append(latency + embedding_latency if include_embedding else latency)
+        embedding_latencies.append(embedding_latency)
+        sizes.append(len(docs))
+
+        names = [normalize_name(doc.page_content) for doc in docs]
+        ranks.append(next((i + 1 for i, name in enumerate(names) if name in example["expected"]), None))
+
+    found = [rank for rank in ranks if rank is not None]
+    return {
+        "setting": setting["label"],
+        "examples": len(examples),
+        "recall": len(found) / len(examples),
+        "recall@10": sum(rank <= 10 for rank in found) / len(examples),
+        "mrr": sum(1 / rank for rank in found) / len(examples),
+        "candidates": float(np.mean(sizes)),
+        "p50_ms": float(np.percentile(latencies, 50)),
+        "p95_ms": float(np.percentile(latencies, 95)),
+        "p99_ms": float(np.percentile(latencies, 99)),
+        "emb_p50_ms": float(np.percentile(embedding_latencies, 50)),
+        "emb_p95_ms": float(np.percentile(embedding_latencies, 95)),
+    }
+
+def print_report(results):
+    header = (
+        f"{'configuração':<48} {'recall':>7} {'rec@10':>7} {'mrr':>6} {'cand.':>7} "
+        f"{'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} {'emb p50':>8} {'emb p95':>8}"
+    )
+    print(header)
+    print("-" * len(header))
+    for r in results:
+        print(
+            f"{r['setting']:<48} {r['recall']:>7.3f} {r['recall@10']:>7.3f} {r['mrr']:>6.3f} "
+            f"{r['candidates']:>7.1f} {r['p50_ms']:>8.1f} {r['p95_ms']:>8.1f} {r['p99_ms']:>8.1f} "
+            f"{r['emb_p50_ms']:>8.1f} {r['emb_p95_ms']:>8.1f}"
+        )
+
+def parse_hnsw(value):
+    try:
+        M, construction_ef, search_ef = (int(part) for part in value.split(":"))
+    except ValueError:
+        raise argparse.ArgumentTypeError("Use o formato M:CONSTRUCTION_EF:SEARCH_EF, ex.: 16:100:10")
+    return M, construction_ef, search_ef
+
+def on_off(value):
+    return {"on": [True], "off": [False], "both": [True, False]}[value]
+
+def main():
+    parser = argparse.ArgumentParser(description="Avalia recall e latência da busca de candidatos com um golden set")
+    parser.add_argument("--golden", default=GOLDEN_FILE, help="Arquivo JSONL com o golden set")
+    parser.add_argument("--limit", type=int, help="Usa apenas os N primeiros exemplos")
+    parser.add_argument("--k", type=int, nargs="+", default=[product_rag.SEARCH_K], help="Valores de k da busca vetorial")
+    parser.add_argument("--max-candidates", type=int, nargs="+", default=[product_rag.MAX_CANDIDATES],
+                        help="Número máximo de candidatos enviados ao LLM")
+    parser.add_argument("--attributes", choices=["on", "off", "both"], default="on",
+                        help="Filtro e reordenação por atributos estruturados")
+    parser.add_argument("--neighbors", choices=["on", "off", "both"], default="on",
+                        help="Uso da tabela de vizinhos pré-calculada")
+    parser.add_argument("--hnsw", type=parse_hnsw, action="append", default=[],
+                        help="Parâmetros HNSW a testar (M:CONSTRUCTION_EF:SEARCH_EF); pode ser repetido")
+    parser.add_argument("--include-embedding", action="store_true",
+                        help="Soma o tempo de embedding do produto alvo à latência das buscas que precisaram dele")
+    parser.add_argument("--output", help="Salva os resultados em JSON")
+    args = parser.parse_args()
+
+    examples = load_golden_set(args.golden, args.limit)
+    if not examples:
+        logger.error(f"Nenhum exemplo válido encontrado em {args.golden}")
+        sys.exit(1)
+    logger.info(f"{len(examples)} exemplos carregados de {args.golden}")
+
+    product_rag.initialize_db()
+    logging.getLogger("product_rag").setLevel(logging.WARNING)
+
+    # Calcula os embeddings dos produtos alvo antes das medições
+    product_rag.embedding_function = CachedEmbeddings(product_rag.embedding_function)
+    warm_up = product_rag.retry_with_exponential_backoff(product_rag.embedding_function.embed_query)
+    for example in examples:
+        warm_up(example["target"])
+
+    product_rag_index = product_rag.vectordb
+    indexes = [("índice atual", product_rag_index)]
+    for M, construction_ef, search_ef in args.hnsw:
+        logger.info(f"Criando índice HNSW de teste (M={M}, construction_ef={construction_ef}, search_ef={search_ef})")
+        indexes.append((f"hnsw {M}:{construction_ef}:{search_ef}", build_hnsw_index(M, construction_ef, search_ef)))
+
+    if args.hnsw and True in on_off(args.neighbors):
+        logger.warning("Índices HNSW de teste são avaliados sem a tabela de vizinhos, que não depende do índice")
+    if True in on_off(args.neighbors) and any(k > NEIGHBORS_TOP_N for k in args.k):
+        logger.warning(f"Para k > {NEIGHBORS_TOP_N} a tabela de vizinhos não é usada (ela guarda {NEIGHBORS_TOP_N} vizinhos)")
+
+    results = []
+    seen = set()
+    for (index_label, index), k, max_candidates, attributes, neighbors in itertools.product(
+        indexes, args.k, args.max_candidates, on_off(args.attributes), on_off(args.neighbors)
+    ):
+        # Com a tabela de vizinhos, os itens do catálogo nunca chegam ao índice HNSW avaliado
+        if index is not product_rag_index:
+            neighbors = False
+        if (index_label, k, max_candidates, attributes, neighbors) in seen:
+            continue
+        seen.add((index_label, k, max_candidates, attributes, neighbors))
+
+        product_rag.vectordb = index
+        setting = {
+            "label": f"{index_label} k={k} max={max_candidates} attr={'on' if attributes else 'off'} "
+                     f"viz={'on' if neighbors else 'off'}",
+            "k": k,
+            "max_candidates": max_candidates,
+            "attributes": attributes,
+            "neighbors": neighbors,
+        }
+        logger.info(f"Avaliando: {setting['label']}")
+        results.append(evaluate(examples, setting, args.include_embedding))
+
+    print_report(results)
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(results, f, ensure_ascii=False, indent=2)
+        logger.info(f"Resultados salvos em {args.output}")
+
+if __name__ == "__main__":
+    main()
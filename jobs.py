@@ -0,0 +1,300 @@
+import sqlite3
+import threading
+import uuid
+import json
+import os
+import time
+import logging
+from concurrent.futures import ThreadPoolExecutor
+
+# Configuração de logging
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+# Configurações dos jobs
+JOBS_DB_FILE = os.getenv("JOBS_DB_FILE", "./jobs.db")
+JOB_WORKERS = int(os.getenv("JOB_WORKERS", "4"))
+# Tentativas por item antes de marcá-lo com erro (ex.: cota da API esgotada, timeout)
+JOB_MAX_ATTEMPTS = int(os.getenv("JOB_MAX_ATTEMPTS", "3"))
+JOB_RETRY_DELAY = float(os.getenv("JOB_RETRY_DELAY", "30"))  # segundos, dobra a cada tentativa
+# Jobs concluídos há mais tempo que isso são removidos do banco
+JOB_RETENTION_DAYS = float(os.getenv("JOB_RETENTION_DAYS", "7"))
+
+# Estados possíveis de um job e de seus itens
+STATUS_PENDENTE = "pendente"
+STATUS_PROCESSANDO = "processando"
+STATUS_CONCLUIDO = "concluido"
+STATUS_ERRO = "erro"
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id TEXT PRIMARY KEY,
+    status TEXT NOT NULL,
+    total INTEGER NOT NULL,
+    created_at REAL NOT NULL,
+    updated_at REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS job_items (
+    job_id TEXT NOT NULL,
+    idx INTEGER NOT NULL,
+    target TEXT,
+    status TEXT NOT NULL,
+    result TEXT,
+    error TEXT,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    seq INTEGER NOT NULL DEFAULT 0,
+    updated_at REAL NOT NULL,
+    PRIMARY KEY (job_id, idx)
+);
+CREATE INDEX IF NOT EXISTS idx_job_items_status ON job_items (status);
+CREATE INDEX IF NOT EXISTS idx_jobs_status ON jobs (status, updated_at);
+"""
+
+# Colunas adicionadas depois da primeira versão do banco
+MIGRATIONS = {
+    "attempts": "ALTER TABLE job_items ADD COLUMN attempts INTEGER NOT NULL DEFAULT 0",
+    "seq": "ALTER TABLE job_items ADD COLUMN seq INTEGER NOT NULL DEFAULT 0",
+}
+
+class JobManager:
+    """Processa listas de produtos em background, persistindo o resultado de cada item no SQLite"""
+
+    def __init__(self, process_func, db_path=JOBS_DB_FILE, max_workers=JOB_WORKERS,
+                 max_attempts=JOB_MAX_ATTEMPTS, retry_delay=JOB_RETRY_DELAY, retention_days=JOB_RETENTION_DAYS):
+        self.process_func = process_func
+        self.db_path = db_path
+        self.max_workers = max_workers
+        self.max_attempts = max_attempts
+        self.retry_delay = retry_delay
+        self.retention_days = retention_days
+        self.executor = None
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(db_path, check_same_thread=False)
+        self.conn.row_factory = sqlite3.Row
+        with self.lock:
+            self.conn.execute("PRAGMA journal_mode=WAL")
+            self.conn.executescript(SCHEMA)
+            columns = {row["name"] for row in self.conn.execute("PRAGMA table_info(job_items)")}
+            for column, statement in MIGRATIONS.items():
+                if column not in columns:
+                    self.conn.execute(statement)
+            self.conn.execute("CREATE INDEX IF NOT EXISTS idx_job_items_seq ON job_items (job_id, seq)")
+            self.conn.commit()
+            # Sequência global das alterações dos itens, mantida em memória a partir daqui
+            self.seq = self.conn.execute("SELECT COALESCE(MAX(seq), 0) FROM job_items").fetchone()[0]
+
+    def start(self):
+        """Inicia o pool de workers e retoma os itens interrompidos em uma execução anterior"""
+        self.executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="job-worker")
+        self.purge_old_jobs()
+
+        with self.lock:
+            # Itens que estavam em processamento quando o serviço parou voltam para a fila.
+            # Itens com erro só são reprocessados por POST /jobs/{id}/retry
+            interrupted = self.conn.execute(
+                "SELECT job_id, idx FROM job_items WHERE status = ?", (STATUS_PROCESSANDO,)
+            ).fetchall()
+            self._requeue(interrupted)
+            self.conn.execute(
+                "UPDATE jobs SET status = ? WHERE id IN (SELECT job_id FROM job_items WHERE status = ?)",
+                (STATUS_PROCESSANDO, STATUS_PENDENTE)
+            )
+            self.conn.commit()
+            pending = self.conn.execute(
+                "SELECT job_id, idx, target FROM job_items WHERE status = ? ORDER BY seq",
+                (STATUS_PENDENTE,)
+            ).fetchall()
+
+        if pending:
+            logger.info(f"Retomando {len(pending)} itens pendentes de jobs anteriores")
+        for row in pending:
+            self.executor.submit(self._run_item, row["job_id"], row["idx"], row["target"])
+
+    def shutdown(self):
+        """Para o pool de workers; itens em andamento serão retomados na próxima inicialização"""
+        if self.executor is not None:
+            self.executor.shutdown(wait=False, cancel_futures=True)
+            self.executor = None
+
+    def purge_old_jobs(self):
+        """Remove os jobs concluídos há mais de `retention_days` dias. Retorna quantos foram removidos"""
+        cutoff = time.time() - self.retention_days * 86400
+        with self.lock:
+            old_jobs = [row["id"] for row in self.conn.execute(
+                "SELECT id FROM jobs WHERE status = ? AND updated_at < ?", (STATUS_CONCLUIDO, cutoff)
+            )]
+            self.conn.executemany("DELETE FROM job_items WHERE job_id = ?", [(job_id,) for job_id in old_jobs])
+            self.conn.executemany("DELETE FROM jobs WHERE id = ?", [(job_id,) for job_id in old_jobs])
+            self.conn.commit()
+        if old_jobs:
+            logger.info(f"{len(old_jobs)} jobs concluídos há mais de {self.retention_days:g} dias removidos")
+        return len(old_jobs)
+
+    def retry_failed(self, job_id):
+        """Recoloca na fila os itens do job que terminaram com erro. Retorna quantos, ou None se o job não existir"""
+        with self.lock:
+            if self.conn.execute("SELECT 1 FROM jobs WHERE id = ?", (job_id,)).fetchone() is None:
+                return None
+            failed = self.conn.execute(
+                "SELECT job_id, idx, target FROM job_items WHERE job_id = ? AND status = ? "
+                "AND target IS NOT NULL AND target != '' ORDER BY idx",
+                (job_id, STATUS_ERRO)
+            ).fetchall()
+            self._requeue(failed, reset_attempts=True)
+            self.conn.commit()
+
+        for row in failed:
+            self.executor.submit(self._run_item, row["job_id"], row["idx"], row["target"])
+        if failed:
+            logger.info(f"Job {job_id}: {len(failed)} itens com erro recolocados na fila")
+        self._refresh_job_status(job_id)
+        return len(failed)
+
+    def submit_job(self, target_products):
+        """Cria um job para a lista de produtos e agenda seus itens. Retorna o id do job"""
+        self.purge_old_jobs()
+        job_id = uuid.uuid4().hex
+        now = time.time()
+
+        with self.lock:
+            items = []
+            for i, target_product in enumerate(target_products):
+                if target_product is None or target_product == "":
+                    items.append((job_id, i, target_product, STATUS_ERRO, None, "Produto não especificado", self._next_seq(), now))
+                else:
+                    items.append((job_id, i, target_product, STATUS_PENDENTE, None, None, self._next_seq(), now))
+
+            self.conn.execute(
+                "INSERT INTO jobs (id, status, total, created_at, updated_at) VALUES (?, ?, ?, ?, ?)",
+                (job_id, STATUS_PENDENTE, len(items), now, now)
+            )
+            self.conn.executemany(
+                "INSERT INTO job_items (job_id, idx, target, status, result, error, seq, updated_at) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                items
+            )
+            self.conn.commit()
+
+        logger.info(f"Job {job_id} criado com {len(items)} produtos")
+
+        for job_id, i, target_product, status, _, _, _, _ in items:
+            if status == STATUS_PENDENTE:
+                self.executor.submit(self._run_item, job_id, i, target_product)
+        self._refresh_job_status(job_id)
+        return job_id
+
+    def get_job(self, job_id, since=None):
+        """
+        Retorna o estado do job e seus itens, ou None se o job não existir.
+        Se `since` for informado, retorna apenas os itens alterados depois desse cursor;
+        o cursor a ser usado na próxima consulta é devolvido em `cursor`.
+        """
+        with self.lock:
+            job = self.conn.execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone()
+            if job is None:
+                return None
+            counts = dict(self.conn.execute(
+                "SELECT status, COUNT(*) FROM job_items WHERE job_id = ? GROUP BY status",
+                (job_id,)
+            ).fetchall())
+            cursor = self.conn.execute(
+                "SELECT COALESCE(MAX(seq), 0) FROM job_items WHERE job_id = ?", (job_id,)
+            ).fetchone()[0]
+            if since is None:
+                rows = self.conn.execute(
+                    "SELECT * FROM job_items WHERE job_id = ? ORDER BY idx", (job_id,)
+                ).fetchall()
+            else:
+                rows = self.conn.execute(
+                    "SELECT * FROM job_items WHERE job_id = ? AND seq > ? ORDER BY seq",
+                    (job_id, since)
+                ).fetchall()
+
+        return {
+            "job_id": job["id"],
+            "status": job["status"],
+            "total": job["total"],
+            "pendentes": counts.get(STATUS_PENDENTE, 0) + counts.get(STATUS_PROCESSANDO, 0),
+            "concluidos": counts.get(STATUS_CONCLUIDO, 0),
+            "erros": counts.get(STATUS_ERRO, 0),
+            "created_at": job["created_at"],
+            "updated_at": job["updated_at"],
+            "cursor": cursor,
+            "items": [self._item_to_dict(row) for row in rows],
+        }
+
+    def _item_to_dict(self, row):
+        return {
+            "produto_idx": row["idx"],
+            "produto": row["target"],
+            "status": row["status"],
+            "result": json.loads(row["result"]) if row["result"] else None,
+            "error": row["error"],
+            "attempts": row["attempts"],
+            "seq": row["seq"],
+            "updated_at": row["updated_at"],
+        }
+
+    def _next_seq(self):
+        """Próximo valor da sequência de alterações dos itens (chamar com o lock adquirido)"""
+        self.seq += 1
+        return self.seq
+
+    def _requeue(self, rows, reset_attempts=False):
+        """Volta os itens para a fila (chamar com o lock adquirido)"""
+        now = time.time()
+        self.conn.executemany(
+            "UPDATE job_items SET status = ?, error = NULL, seq = ?, updated_at = ?"
+            + (", attempts = 0" if reset_attempts else "")
+            + " WHERE job_id = ? AND idx = ?",
+            [(STATUS_PENDENTE, self._next_seq(), now, row["job_id"], row["idx"]) for row in rows]
+        )
+
+    def _set_item(self, job_id, idx, status, result=None, error=None):
+        with self.lock:
+            self.conn.execute(
+                "UPDATE job_items SET status = ?, result = ?, error = ?, seq = ?, updated_at = ?"
+                + (", attempts = attempts + 1" if status == STATUS_PROCESSANDO else "")
+                + " WHERE job_id = ? AND idx = ?",
+                (status, json.dumps(result, ensure_ascii=False) if result is not None else None,
+                 error, self._next_seq(), time.time(), job_id, idx)
+            )
+            self.conn.commit()
+
+    def _refresh_job_status(self, job_id):
+        """Atualiza o status do job de acordo com o estado dos seus itens"""
+        with self.lock:
+            remaining = self.conn.execute(
+                "SELECT COUNT(*) FROM job_items WHERE job_id = ? AND status IN (?, ?)",
+                (job_id, STATUS_PENDENTE, STATUS_PROCESSANDO)
+            ).fetchone()[0]
+            status = STATUS_PROCESSANDO if remaining else STATUS_CONCLUIDO
+            self.conn.execute(
+                "UPDATE jobs SET status = ?, updated_at = ? WHERE id = ?",
+                (status, time.time(), job_id)
+            )
+            self.conn.commit()
+
+    def _run_item(self, job_id, idx, target_product):
+        """Processa um item do job em uma thread do pool, com até `max_attempts` tentativas"""
+        self._refresh_job_status(job_id)
+        for attempt in range(1, self.max_attempts + 1):
+            self._set_item(job_id, idx, STATUS_PROCESSANDO)
+            try:
+                start_time = time.time()
+                result = self.process_func(target_product)
+                logger.info(f"Job {job_id}: produto {idx} processado em {time.time() - start_time:.2f} segundos")
+                self._set_item(job_id, idx, STATUS_CONCLUIDO, result=result)
+                break
+            except Exception as e:
+                if attempt >= self.max_attempts:
+                    logger.error(f"Job {job_id}: erro ao processar produto {idx} ({target_product}): {str(e)}")
+                    self._set_item(job_id, idx, STATUS_ERRO, error=str(e))
+                    break
+                delay = self.retry_delay * (2 ** (attempt - 1))
+                logger.warning(
+                    f"Job {job_id}: erro ao processar produto {idx} ({target_product}), tentativa "
+                    f"{attempt}/{self.max_attempts}. Nova tentativa em {delay:.0f} segundos: {str(e)}"
+                )
+                time.sleep(delay)
+        self._refresh_job_status(job_id)
@@ -0,0 +1,266 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import os
+import time
+import logging
+import numpy as np
+
+# Configuração de logging
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+# Caminho da tabela de vizinhos pré-calculada
+NEIGHBORS_FILE = os.getenv("NEIGHBORS_FILE", "./neighbors.npz")
+
+# Número de vizinhos guardados por item (mesmo k usado na busca vetorial)
+NEIGHBORS_TOP_N = 300
+
+# Memória usada por bloco da matriz de similaridade (similaridades float32 + índices int64 do argpartition)
+NEIGHBORS_MEMORY_MB = int(os.getenv("NEIGHBORS_MEMORY_MB", "256"))
+BYTES_PER_CELL = 4 + 8
+
+def normalize_name(name: str) -> str:
+    """Normaliza o nome do item para a busca na tabela"""
+    return " ".join(name.split()).upper()
+
+class NeighborTable:
+    """Tabela compacta com os N vizinhos mais próximos de cada item do catálogo"""
+
+    def __init__(self, names, neighbors, scores):
+        self.names = names
+        self.neighbors = neighbors
+        self.scores = scores
+        self.index = {normalize_name(name): i for i, name in enumerate(names)}
+
+    def lookup(self, product_name: str):
+        """
+        Retorna o nome do item como está no catálogo e a lista de vizinhos (nome, similaridade),
+        ou None se o item não estiver na tabela
+        """
+        row = self.index.get(normalize_name(product_name))
+        if row is None:
+            return None
+        neighbors = [
+            (str(self.names[j]), float(score))
+            for j, score in zip(self.neighbors[row], self.scores[row])
+            if j >= 0
+        ]
+        return str(self.names[row]), neighbors
+
+    def save(self, path=NEIGHBORS_FILE):
+        """Salva a tabela de forma atômica para não afetar a API que está lendo o arquivo"""
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, "wb") as f:
+            np.savez(
+                f,
+                names=np.asarray(self.names, dtype=str),
+                neighbors=self.neighbors.astype(np.int32),
+                # float32 para que as atualizações incrementais tenham o mesmo resultado do cálculo completo
+                scores=self.scores.astype(np.float32),
+            )
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path=NEIGHBORS_FILE):
+        with np.load(path, allow_pickle=False) as data:
+            return cls(data["names"], data["neighbors"], data["scores"].astype(np.float32))
+
+_table = None
+_table_mtime = None
+
+def get_neighbor_table(products_file=None):
+    """
+    Retorna a tabela de vizinhos carregada, recarregando se o arquivo foi reconstruído.
+    None se não existir ou se for mais antiga que o arquivo de produtos (catálogo desatualizado).
+    """
+    global _table, _table_mtime
+
+    if not os.path.exists(NEIGHBORS_FILE):
+        return None
+
+    mtime = os.path.getmtime(NEIGHBORS_FILE)
+    if products_file and os.path.exists(products_file) and os.path.getmtime(products_file) > mtime:
+        if _table_mtime != -mtime:
+            logger.warning(f"Tabela de vizinhos mais antiga que {products_file}; ignorando até ser recalculada (python neighbors.py)")
+            _table = None
+            _table_mtime = -mtime
+        return None
+
+    if _table is None or mtime != _table_mtime:
+        try:
+            _table = NeighborTable.load(NEIGHBORS_FILE)
+            _table_mtime = mtime
+            logger.info(f"Tabela de vizinhos carregada de {NEIGHBORS_FILE} ({len(_table.names)} itens)")
+        except Exception as e:
+            logger.error(f"Erro ao carregar tabela de vizinhos: {str(e)}")
+            return None
+    return _table
+
+def top_n(similarities, n):
+    """
+    Seleciona, para cada linha, os n maiores valores em ordem decrescente.
+    A matriz é alterada no lugar para não alocar uma cópia dela.
+    """
+    n = min(n, similarities.shape[1])
+    np.negative(similarities, out=similarities)
+    idx = np.argpartition(similarities, n - 1, axis=1)[:, :n]
+    part = np.take_along_axis(similarities, idx, axis=1)
+    order = np.argsort(part, axis=1)
+    idx = np.take_along_axis(idx, order, axis=1)
+    part = np.negative(np.take_along_axis(part, order, axis=1))
+    return idx, part
+
+def compute_neighbors(embeddings, rows, columns, n=NEIGHBORS_TOP_N, memory_mb=NEIGHBORS_MEMORY_MB):
+    """
+    Calcula os n vizinhos mais próximos de cada item de `rows` entre os itens de `columns`,
+    em blocos de linhas que cabem em `memory_mb`. Retorna índices globais e similaridades.
+    """
+    n = min(n, len(columns))
+    neighbors = np.full((len(rows), n), -1, dtype=np.int32)
+    scores = np.full((len(rows), n), -np.inf, dtype=np.float32)
+    if len(columns) == 0:
+        return neighbors, scores
+
+    block_size = max(1, memory_mb * 2**20 // (BYTES_PER_CELL * len(columns)))
+    column_embeddings = embeddings[columns]
+    # Posição de cada item entre as colunas (-1 se não estiver), para excluir o próprio item
+    column_position = np.full(len(embeddings), -1, dtype=np.int64)
+    column_position[columns] = np.arange(len(columns))
+    for start in range(0, len(rows), block_size):
+        block = rows[start:start + block_size]
+        similarities = embeddings[block] @ column_embeddings.T
+        # Um item não é vizinho de si mesmo
+        position = column_position[block]
+        own = np.nonzero(position >= 0)[0]
+        similarities[own, position[own]] = -np.inf
+        idx, part = top_n(similarities, n)
+        del similarities
+        neighbors[start:start + len(block), :idx.shape[1]] = columns[idx]
+        scores[start:start + len(block), :part.shape[1]] = part
+
+    neighbors[~np.isfinite(scores)] = -1
+    return neighbors, scores
+
+def load_catalog_embeddings():
+    """
+    Lê os nomes e embeddings já armazenados no banco vetorial, sem novas chamadas de embedding.
+    Depois do update_products.py, que remove o banco, ele é criado aqui uma única vez; a API
+    em execução detecta o banco novo e o recarrega sem calcular os embeddings de novo.
+    """
+    import product_rag
+
+    # Se o catálogo foi atualizado depois da criação do banco vetorial, recria o banco antes
+    if (os.path.exists(product_rag.products_file) and os.path.exists(product_rag.persist_directory)
+            and os.path.getmtime(product_rag.products_file) > os.path.getmtime(product_rag.persist_directory)):
+        logger.info("Arquivo de produtos mais recente que o banco vetorial. Recriando o banco...")
+        product_rag.recreate_db()
+    elif product_rag.vectordb is None:
+        product_rag.initialize_db()
+
+    data = product_rag.vectordb.get(include=["documents", "embeddings"])
+
+    # Remove itens duplicados, mantendo a primeira ocorrência
+    names = []
+    vectors = []
+    seen = set()
+    for name, vector in zip(data["documents"], data["embeddings"]):
+        if name not in seen:
+            seen.add(name)
+            names.append(name)
+            vectors.append(vector)
+
+    embeddings = np.asarray(vectors, dtype=np.float32)
+    embeddings /= np.maximum(np.linalg.norm(embeddings, axis=1, keepdims=True), 1e-12)
+    return names, embeddings
+
+def build_neighbor_table(names, embeddings, previous=None, n=NEIGHBORS_TOP_N):
+    """
+    Constrói a tabela de vizinhos. Se `previous` for informada, recalcula por completo apenas
+    os itens novos e os que perderam vizinhos removidos do catálogo; os demais só são comparados
+    com os itens novos.
+    """
+    all_rows = np.arange(len(names))
+
+    if previous is None:
+        neighbors, scores = compute_neighbors(embeddings, all_rows, all_rows, n)
+        return NeighborTable(np.asarray(names, dtype=str), neighbors, scores)
+
+    position = {name: i for i, name in enumerate(names)}
+    previous_names = [str(name) for name in previous.names]
+    previous_position = {name: i for i, name in enumerate(previous_names)}
+    # Mapeia os índices da tabela anterior para os índices atuais (-1 se o item foi removido)
+    remap = np.array([position.get(name, -1) for name in previous_names] + [-1], dtype=np.int32)
+
+    added = np.array([i for i, name in enumerate(names) if name not in previous_position], dtype=np.int64)
+    width = min(n, len(names))
+    neighbors = np.full((len(names), width), -1, dtype=np.int32)
+    scores = np.full((len(names), width), -np.inf, dtype=np.float32)
+
+    full_rows = list(added)
+    kept_rows = []
+    for i, name in enumerate(names):
+        if name not in previous_position:
+            continue
+        old_row = previous_position[name]
+        old_neighbors = remap[previous.neighbors[old_row]]
+        # Se algum vizinho foi removido, não sabemos qual seria o próximo: recalcula a linha inteira
+        if (old_neighbors < 0).any() or previous.neighbors.shape[1] < width:
+            full_rows.append(i)
+        else:
+            kept_rows.append(i)
+            neighbors[i] = old_neighbors[:width]
+            scores[i] = previous.scores[old_row][:width]
+
+    logger.info(
+        f"Atualização incremental: {len(added)} itens novos, "
+        f"{len(previous_names) - (len(names) - len(added))} removidos, "
+        f"{len(full_rows)} linhas recalculadas"
+    )
+
+    full_rows = np.array(sorted(full_rows), dtype=np.int64)
+    if len(full_rows):
+        neighbors[full_rows], scores[full_rows] = compute_neighbors(embeddings, full_rows, all_rows, width)
+
+    # Itens que não mudaram só precisam ser comparados com os itens novos
+    kept_rows = np.array(kept_rows, dtype=np.int64)
+    if len(kept_rows) and len(added):
+        new_neighbors, new_scores = compute_neighbors(embeddings, kept_rows, added, width)
+        merged_neighbors = np.concatenate([neighbors[kept_rows], new_neighbors], axis=1)
+        merged_scores = np.concatenate([scores[kept_rows], new_scores], axis=1)
+        idx, part = top_n(merged_scores, width)
+        neighbors[kept_rows] = np.take_along_axis(merged_neighbors, idx, axis=1)
+        scores[kept_rows] = part
+
+    neighbors[~np.isfinite(scores)] = -1
+    return NeighborTable(np.asarray(names, dtype=str), neighbors, scores)
+
+def update_neighbor_table(full=False):
+    """
+    Função principal: lê os embeddings do banco vetorial e atualiza a tabela de vizinhos.
+    Deve ser executada depois do update_products.py, quando o banco vetorial já foi recriado.
+    """
+    logger.info("Iniciando cálculo da tabela de vizinhos...")
+    start_time = time.time()
+
+    names, embeddings = load_catalog_embeddings()
+    if not names:
+        logger.error("Nenhum item encontrado no banco vetorial. Abortando.")
+        return False
+
+    previous = None
+    if not full and os.path.exists(NEIGHBORS_FILE):
+        try:
+            previous = NeighborTable.load(NEIGHBORS_FILE)
+        except Exception as e:
+            logger.warning(f"Erro ao carregar tabela anterior, recalculando tudo: {str(e)}")
+
+    table = build_neighbor_table(names, embeddings, previous)
+    table.save(NEIGHBORS_FILE)
+
+    logger.info(f"Tabela de vizinhos salva em {NEIGHBORS_FILE} ({len(names)} itens) em {time.time() - start_time:.2f} segundos")
+    return True
+
+if __name__ == "__main__":
+    import sys
+    sys.exit(0 if update_neighbor_table(full="--full" in sys.argv) else 1)
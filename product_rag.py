@@ -2,13 +2,20 @@ from langchain_google_genai import GoogleGenerativeAIEmbeddings
 from langchain_community.document_loaders import JSONLoader
 from langchain_text_splitters import RecursiveCharacterTextSplitter
 from langchain_chroma import Chroma
+from langchain_core.documents import Document
 from dotenv import load_dotenv
 import os
 import google.generativeai as genai
 import time
 import random
 import logging
+import threading
 from langchain_google_genai._common import GoogleGenerativeAIError
+from neighbors import get_neighbor_table, NEIGHBORS_TOP_N
+from attributes import (
+    ATTRIBUTES_FILE, parse_attributes, attribute_metadata, attribute_filter,
+    build_attribute_index, rank_candidates
+)
 
 # Configuração de logging
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
@@ -20,11 +27,21 @@ products_file = "./products.json"
 vectordb = None
 embedding_function = None
 
+# Arquivo gravado no banco vetorial ao fim da sua criação. Quando outro processo recria o banco
+# (update_products.py seguido de neighbors.py), a API compara a data do arquivo e recarrega o banco
+DB_READY_FILE = "db_ready"
+vectordb_version = None
+reload_lock = threading.Lock()
+
 # Configurações de retry
 MAX_RETRIES = 5
 INITIAL_RETRY_DELAY = 60  # segundos
 MAX_RETRY_DELAY = 600  # 10 minutos
 
+# Configurações da busca
+SEARCH_K = 300  # candidatos retornados pela busca vetorial
+MAX_CANDIDATES = 100  # candidatos enviados ao LLM depois da reordenação por atributos
+
 def retry_with_exponential_backoff(func):
     """Decorator para implementar retry com backoff exponencial"""
     def wrapper(*args, **kwargs):
@@ -48,9 +65,31 @@ def retry_with_exponential_backoff(func):
                     raise
     return wrapper
 
+def get_db_version():
+    """Data de criação do banco vetorial em disco, ou None se ele não existir ou ainda estiver sendo criado"""
+    ready_file = os.path.join(persist_directory, DB_READY_FILE)
+    return os.path.getmtime(ready_file) if os.path.exists(ready_file) else None
+
+def reload_db_if_rebuilt():
+    """Recarrega o banco vetorial se ele foi recriado por outro processo depois de carregado"""
+    global vectordb
+
+    version = get_db_version()
+    if vectordb is None or version is None or version == vectordb_version:
+        return
+    with reload_lock:
+        if get_db_version() == vectordb_version:
+            return
+        logger.info("Banco vetorial recriado por outro processo. Recarregando...")
+        # O chromadb guarda os clientes por diretório; sem limpar o cache o banco antigo continuaria em uso
+        from chromadb.api.client import SharedSystemClient
+        SharedSystemClient.clear_system_cache()
+        vectordb = None
+        initialize_db()
+
 def initialize_db():
     """Inicializa o banco de dados vetorial apenas uma vez"""
-    global vectordb, embedding_function
+    global vectordb, embedding_function, vectordb_version
     
     # Carrega as variáveis de ambiente
     load_dotenv()
@@ -77,6 +116,10 @@ def initialize_db():
                 persist_directory=persist_directory,
                 embedding_function=embedding_function
             )
+            vectordb_version = get_db_version()
+            # Gera o índice de atributos caso o banco tenha sido criado antes dele existir
+            if not os.path.exists(ATTRIBUTES_FILE) and os.path.exists(products_file):
+                build_attribute_index(products_file)
             return
         except Exception as e:
             # Se ocorrer erro ao carregar o banco existente (como incompatibilidade de versão),
@@ -102,11 +145,19 @@ def initialize_db():
     )
     products = loader.load()
 
+    # Extrai os atributos estruturados (medida, embalagem, categoria) de cada item
+    for product in products:
+        product.metadata.update(attribute_metadata(parse_attributes(product.page_content)))
+    build_attribute_index(products_file)
+
     text_splitter = RecursiveCharacterTextSplitter(chunk_size=1000, chunk_overlap=200)
     all_splits = text_splitter.split_documents(products)
 
     # Cria o banco de vetores e persiste com retry
     create_vector_db_with_retry(all_splits)
+    with open(os.path.join(persist_directory, DB_READY_FILE), "w", encoding="utf-8") as f:
+        f.write(str(time.time()))
+    vectordb_version = get_db_version()
     logger.info(f"Banco de dados criado com sucesso em {persist_directory}")
 
 @retry_with_exponential_backoff
@@ -135,26 +186,82 @@ def recreate_db():
     vectordb = None
     initialize_db()
 
-def get_similar_products(product_name: str):
-    """Busca produtos similares no banco de dados vetorial"""
+def get_similar_products(product_name: str, k=SEARCH_K, max_candidates=MAX_CANDIDATES,
+                         use_attributes=True, use_neighbors=True):
+    """
+    Busca produtos similares no banco de dados vetorial.
+    Os parâmetros permitem comparar configurações de busca (ver evaluate_retrieval.py);
+    os valores padrão são os usados pela API.
+    """
     global vectordb
     
-    # Inicializa o banco de dados se ainda não foi inicializado
-    if vectordb is None:
-        initialize_db()
+    target_attributes = parse_attributes(product_name)
+    
+    # Se o produto for um item do catálogo, usa a tabela de vizinhos pré-calculada
+    candidates = get_precomputed_neighbors(product_name, k) if use_neighbors else None
+    if candidates is None:
+        # Inicializa o banco de dados se ainda não foi inicializado
+        if vectordb is None:
+            initialize_db()
+        reload_db_if_rebuilt()
+        
+        # Realiza a busca por similaridade com retry
+        candidates = search_products_with_retry(product_name, target_attributes, k, use_attributes)
     
-    # Realiza a busca por similaridade com retry
-    return search_products_with_retry(product_name)
+    # Descarta itens com medida incompatível e prioriza os que têm os mesmos atributos do produto alvo
+    if use_attributes:
+        positions = rank_candidates(target_attributes, [doc.page_content for doc in candidates], max_candidates)
+    else:
+        positions = list(range(min(len(candidates), max_candidates)))
+    logger.info(f"Candidatos enviados para análise: {len(positions)} de {len(candidates)}")
+    return [candidates[i] for i in positions]
+
+def get_precomputed_neighbors(product_name: str, k=SEARCH_K):
+    """Retorna os vizinhos pré-calculados do produto, ou None se ele não estiver na tabela"""
+    # A tabela guarda apenas NEIGHBORS_TOP_N vizinhos; para k maior, usa a busca vetorial
+    if k > NEIGHBORS_TOP_N:
+        return None
+    
+    table = get_neighbor_table(products_file)
+    if table is None:
+        return None
+    
+    found = table.lookup(product_name)
+    if found is None:
+        return None
+    
+    item_name, neighbors = found
+    logger.info(f"Produto encontrado na tabela de vizinhos: {item_name} ({len(neighbors)} vizinhos)")
+    # O próprio item (com o nome do catálogo) vem primeiro, como aconteceria na busca vetorial
+    return [Document(page_content=item_name)] + [Document(page_content=name) for name, score in neighbors[:k - 1]]
 
 @retry_with_exponential_backoff
-def search_products_with_retry(product_name: str):
+def search_products_with_retry(product_name: str, target_attributes: dict, k=SEARCH_K, use_attributes=True):
     """Realiza a busca por similaridade com retry em caso de erro de cota"""
-    global vectordb
+    global vectordb, embedding_function
     
     logger.info(f"Buscando produtos similares a: {product_name}")
     
-    # Realiza a busca por similaridade
-    retrieved_docs = vectordb.similarity_search_with_score(product_name, k=300)
+    # Calcula o embedding uma única vez para as duas buscas
+    query_embedding = embedding_function.embed_query(product_name)
+    
+    # Primeiro busca apenas entre os itens com exatamente a mesma medida do produto alvo, para que eles
+    # entrem nos candidatos mesmo que estejam fora dos k mais próximos da busca sem filtro
+    retrieved_docs = []
+    where = attribute_filter(target_attributes) if use_attributes else None
+    if where is not None:
+        try:
+            retrieved_docs = vectordb.similarity_search_by_vector_with_relevance_scores(
+                query_embedding, k=k, filter=where
+            )
+            logger.info(f"Busca filtrada por atributos retornou {len(retrieved_docs)} documentos")
+        except Exception as e:
+            # O índice HNSW pode falhar em filtros muito restritivos; nesse caso usa apenas a busca sem filtro
+            logger.warning(f"Erro na busca filtrada por atributos: {str(e)}")
+    
+    # Complementa sempre com a busca sem filtro: a mesma medida pode estar escrita de outra forma
+    # (ex.: 6MM e 6X210MM); a seleção final fica com rank_candidates
+    retrieved_docs += vectordb.similarity_search_by_vector_with_relevance_scores(query_embedding, k=k)
 
     filtered_docs = [(doc, score) for doc, score in retrieved_docs]
 
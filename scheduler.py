@@ -4,6 +4,7 @@
 import schedule
 import time
 from update_products import update_products
+from neighbors import update_neighbor_table
 import logging
 
 # Configuração de logging
@@ -23,6 +24,11 @@ def job():
         success = update_products()
         if success:
             logger.info("Job de atualização concluído com sucesso")
+            # Recalcula a tabela de vizinhos para o novo catálogo
+            if update_neighbor_table():
+                logger.info("Tabela de vizinhos atualizada com sucesso")
+            else:
+                logger.error("Falha ao atualizar a tabela de vizinhos")
         else:
             logger.error("Job de atualização falhou")
     except Exception as e:
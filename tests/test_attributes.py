@@ -0,0 +1,79 @@
+import pytest
+
+import attributes
+from attributes import parse_attributes, compare_sizes, rank_candidates
+
+@pytest.fixture(autouse=True)
+def no_attribute_index(tmp_path, monkeypatch):
+    # Sem índice salvo, os atributos dos candidatos são extraídos na hora
+    monkeypatch.setattr(attributes, "ATTRIBUTES_FILE", str(tmp_path / "attributes.npz"))
+
+@pytest.mark.parametrize("item_name, size_dims, size_unit, pack_qty, category", [
+    ("INS CANUDO 10MM 100 UN", "10", "MM", 100, "INS"),
+    ("CANUDO 1CM C/100", "10", "MM", 100, "CANUDO"),
+    ("CANUDO FLEXIVEL 6X210MM 100 UN", "6X210", "MM", 100, "CANUDO"),
+    ("SACO PLASTICO 30X40CM PCT 50", "300X400", "MM", 50, "SACO"),
+    ("CAIXA PAPELAO 10X20X30CM", "100X200X300", "MM", 0, "CAIXA"),
+    ("DETERGENTE 1,5L CX 12", "1500", "ML", 12, "DETERGENTE"),
+    ("COPO DESC 200ML C/100 UND", "200", "ML", 100, "COPO"),
+    ("PAPEL A4 75G 500 FLS", "75", "G", 500, "PAPEL"),
+    ("ACUCAR 1KG", "1000", "G", 0, "ACUCAR"),
+    ("MARCADOR PERMANENTE AZUL", "", "", 0, "MARCADOR"),
+])
+def test_parse_attributes(item_name, size_dims, size_unit, pack_qty, category):
+    attrs = parse_attributes(item_name)
+    assert attrs["size_dims"] == size_dims
+    assert attrs["size_unit"] == size_unit
+    assert attrs["pack_qty"] == pack_qty
+    assert attrs["category"] == category
+
+@pytest.mark.parametrize("item_name", [
+    "FITA ADESIVA 12MMX50M",
+    "FITA ADESIVA 12MM X 50M",
+    "FITA ADESIVA 12X50M",
+    "FITA ADESIVA 12 X 50 M",
+    "FITA ADESIVA 12X50MTS",
+])
+def test_tape_width_is_not_scaled_to_meters(item_name):
+    assert parse_attributes(item_name)["size_dims"] == "12X50000"
+
+def test_parse_ignores_case_and_spacing():
+    assert parse_attributes("ins  canudo 10mm 100 un") == parse_attributes("INS CANUDO 10MM 100 UN")
+
+def test_words_are_not_units():
+    attrs = parse_attributes("MARCADOR 2 MARCAS")
+    assert attrs["size_dims"] == ""
+    assert "MARCAS" in attrs["tokens"].split()
+
+@pytest.mark.parametrize("target, candidate, expected", [
+    ("10", "10", 2),
+    ("6", "6X210", 1),
+    ("300X400", "400X300", 1),
+    ("8", "10", -1),
+    ("300X400", "300X500", -1),
+    ("8", "6X210", 0),
+])
+def test_compare_sizes(target, candidate, expected):
+    assert compare_sizes(target, candidate) == expected
+
+def test_rank_drops_only_comparable_conflicts():
+    target = parse_attributes("CANUDO 6MM")
+    names = ["CANUDO 8MM"] * 12 + ["CANUDO FLEXIVEL 6X210MM 100 UN", "CANUDO 6MM 100 UN"]
+    ranked = [names[i] for i in rank_candidates(target, names, max_candidates=100, min_candidates=2)]
+    assert ranked == ["CANUDO 6MM 100 UN", "CANUDO FLEXIVEL 6X210MM 100 UN"]
+
+def test_rank_keeps_differently_written_tape():
+    target = parse_attributes("FITA ADESIVA 12MM X 50M")
+    names = ["FITA ADESIVA 18MMX50M"] * 12 + ["FITA ADESIVA 12X50M"]
+    ranked = [names[i] for i in rank_candidates(target, names, max_candidates=100, min_candidates=1)]
+    assert ranked == ["FITA ADESIVA 12X50M"]
+
+def test_rank_keeps_conflicts_when_few_candidates_remain():
+    target = parse_attributes("CANUDO 6MM")
+    names = ["CANUDO 8MM", "CANUDO 6MM"]
+    assert rank_candidates(target, names, max_candidates=100) == [1, 0]
+
+def test_rank_respects_max_candidates():
+    target = parse_attributes("MARCADOR AZUL")
+    names = [f"MARCADOR {i}" for i in range(20)]
+    assert rank_candidates(target, names, max_candidates=5) == [0, 1, 2, 3, 4]
@@ -0,0 +1,105 @@
+import json
+import sys
+import types
+
+import pytest
+
+try:
+    import product_rag  # noqa: F401
+except ImportError:
+    # Sem as dependências do langchain, o product_rag é substituído nos testes; get_similar_products é sempre simulado
+    stub = types.ModuleType("product_rag")
+    stub.SEARCH_K = 300
+    stub.MAX_CANDIDATES = 100
+    sys.modules["product_rag"] = stub
+
+import evaluate_retrieval
+from evaluate_retrieval import CachedEmbeddings, load_golden_set, evaluate
+
+SETTING = {"label": "teste", "k": 300, "max_candidates": 100, "attributes": True, "neighbors": True}
+
+class Doc:
+    def __init__(self, page_content):
+        self.page_content = page_content
+
+class FakeEmbeddings:
+    def embed_query(self, text):
+        return [float(len(text))]
+
+    def embed_documents(self, texts):
+        return [self.embed_query(text) for text in texts]
+
+def write_golden(tmp_path, lines):
+    path = tmp_path / "golden.jsonl"
+    path.write_text("\n".join(lines) + "\n", encoding="utf-8")
+    return str(path)
+
+def test_load_golden_set(tmp_path):
+    path = write_golden(tmp_path, [
+        json.dumps({"target": "CANUDO 10MM", "expected": ["INS CANUDO 10MM 100 UN", "canudo  10mm"]}),
+        "",
+        json.dumps({"target": "COPO 200ML", "expected": "copo desc 200ml"}),
+        json.dumps({"target": "", "expected": ["SEM ALVO"]}),
+        json.dumps({"expected": ["SEM ALVO"]}),
+        json.dumps({"target": "SEM ESPERADO", "expected": []}),
+        json.dumps({"target": "NENHUM ITEM"}),
+        "   ",
+    ])
+    examples = load_golden_set(path)
+    assert examples == [
+        {"target": "CANUDO 10MM", "expected": {"INS CANUDO 10MM 100 UN", "CANUDO 10MM"}},
+        {"target": "COPO 200ML", "expected": {"COPO DESC 200ML"}},
+    ]
+    assert load_golden_set(path, limit=1) == examples[:1]
+
+def test_evaluate_metrics(monkeypatch):
+    results = {
+        "A": ["A1", "A2"],                                # encontrado na posição 1
+        "B": [f"X{i}" for i in range(11)] + ["B1"],       # posição 12: fora do recall@10
+        "C": ["X1", "c1"],                                # posição 2, com outra grafia
+        "D": ["X1"],                                      # não encontrado
+    }
+    monkeypatch.setattr(evaluate_retrieval.product_rag, "get_similar_products",
+                        lambda target, **kwargs: [Doc(name) for name in results[target]], raising=False)
+    monkeypatch.setattr(evaluate_retrieval.product_rag, "embedding_function", None, raising=False)
+    examples = [{"target": target, "expected": {target + "1"}} for target in results]
+
+    metrics = evaluate(examples, SETTING)
+    assert metrics["examples"] == 4
+    assert metrics["recall"] == pytest.approx(3 / 4)
+    assert metrics["recall@10"] == pytest.approx(2 / 4)
+    assert metrics["mrr"] == pytest.approx((1 + 1 / 12 + 1 / 2) / 4)
+    assert metrics["candidates"] == pytest.approx((2 + 12 + 2 + 1) / 4)
+    assert metrics["emb_p50_ms"] == 0.0
+
+def test_evaluate_embedding_latency(monkeypatch):
+    embeddings = CachedEmbeddings(FakeEmbeddings())
+    embeddings.embed_query("VETORIAL")
+    embeddings.embed_query("VIZINHOS")
+    embeddings.latencies = {"VETORIAL": 50.0, "VIZINHOS": 50.0}
+
+    def get_similar_products(target, **kwargs):
+        # Só a busca vetorial calcula o embedding; a tabela de vizinhos não precisa dele
+        if target == "VETORIAL":
+            embeddings.embed_query(target)
+        return [Doc(target)]
+
+    monkeypatch.setattr(evaluate_retrieval.product_rag, "get_similar_products", get_similar_products, raising=False)
+    monkeypatch.setattr(evaluate_retrieval.product_rag, "embedding_function", embeddings, raising=False)
+    examples = [{"target": "VETORIAL", "expected": {"VETORIAL"}}, {"target": "VIZINHOS", "expected": {"VIZINHOS"}}]
+
+    metrics = evaluate(examples, SETTING)
+    assert metrics["emb_p95_ms"] == pytest.approx(47.5)
+    assert metrics["p99_ms"] < 45
+
+    # Os 50 ms de embedding entram apenas na latência da busca vetorial
+    with_embedding = evaluate(examples, SETTING, include_embedding=True)
+    assert with_embedding["p99_ms"] > 45
+    assert with_embedding["p50_ms"] == pytest.approx(25, abs=5)
+
+def test_main_fails_without_examples(tmp_path, monkeypatch):
+    path = write_golden(tmp_path, [json.dumps({"target": "SEM ESPERADO", "expected": []})])
+    monkeypatch.setattr(sys, "argv", ["evaluate_retrieval.py", "--golden", path])
+    with pytest.raises(SystemExit) as exit_info:
+        evaluate_retrieval.main()
+    assert exit_info.value.code == 1
@@ -0,0 +1,157 @@
+import time
+
+import pytest
+
+from jobs import JobManager, STATUS_PROCESSANDO, STATUS_CONCLUIDO, STATUS_ERRO
+
+def process_ok(target):
+    return {"target": target}
+
+def process_fail(target):
+    raise RuntimeError(f"falha em {target}")
+
+@pytest.fixture
+def make_manager(tmp_path):
+    managers = []
+
+    def make(process_func=process_ok, **kwargs):
+        kwargs.setdefault("max_workers", 2)
+        kwargs.setdefault("retry_delay", 0)
+        manager = JobManager(process_func, db_path=str(tmp_path / "jobs.db"), **kwargs)
+        manager.start()
+        managers.append(manager)
+        return manager
+
+    yield make
+    for manager in managers:
+        manager.shutdown()
+
+def wait_for_job(manager, job_id, timeout=5):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        job = manager.get_job(job_id)
+        if job["status"] == STATUS_CONCLUIDO:
+            return job
+        time.sleep(0.01)
+    raise AssertionError(f"Job {job_id} não terminou em {timeout} segundos")
+
+def test_job_runs_all_items(make_manager):
+    manager = make_manager()
+    job_id = manager.submit_job(["CANUDO 10MM", "COPO 200ML"])
+    job = wait_for_job(manager, job_id)
+    assert (job["total"], job["concluidos"], job["erros"], job["pendentes"]) == (2, 2, 0, 0)
+    assert [item["result"] for item in job["items"]] == [{"target": "CANUDO 10MM"}, {"target": "COPO 200ML"}]
+
+def test_job_with_only_empty_targets_is_finished(make_manager):
+    manager = make_manager()
+    job_id = manager.submit_job(["", None])
+    job = manager.get_job(job_id)
+    assert job["status"] == STATUS_CONCLUIDO
+    assert job["erros"] == 2
+    assert {item["error"] for item in job["items"]} == {"Produto não especificado"}
+
+def test_item_is_retried_until_it_succeeds(make_manager):
+    calls = []
+
+    def flaky(target):
+        calls.append(target)
+        if len(calls) < 3:
+            raise RuntimeError("cota esgotada")
+        return {"target": target}
+
+    manager = make_manager(flaky, max_attempts=3)
+    job = wait_for_job(manager, manager.submit_job(["CANUDO 10MM"]))
+    assert job["concluidos"] == 1
+    assert job["items"][0]["attempts"] == 3
+
+def test_item_fails_after_max_attempts(make_manager):
+    manager = make_manager(process_fail, max_attempts=2)
+    job = wait_for_job(manager, manager.submit_job(["CANUDO 10MM"]))
+    item = job["items"][0]
+    assert (item["status"], item["attempts"]) == (STATUS_ERRO, 2)
+    assert item["error"] == "falha em CANUDO 10MM"
+
+def test_since_returns_only_changed_items(make_manager):
+    manager = make_manager()
+    job_id = manager.submit_job(["A", "B", "C"])
+    job = wait_for_job(manager, job_id)
+    cursor = job["cursor"]
+    assert manager.get_job(job_id, since=cursor)["items"] == []
+
+    # Um item que volta para a fila aparece de novo a partir do cursor anterior
+    with manager.lock:
+        manager.conn.execute("UPDATE job_items SET status = ? WHERE job_id = ? AND idx = 1", (STATUS_ERRO, job_id))
+        manager.conn.commit()
+    assert manager.retry_failed(job_id) == 1
+    wait_for_job(manager, job_id)
+    changed = manager.get_job(job_id, since=cursor)
+    assert {item["produto"] for item in changed["items"]} == {"B"}
+    assert changed["cursor"] > cursor
+    assert all(item["seq"] > cursor for item in changed["items"])
+
+def test_retry_failed(make_manager):
+    fail = True
+
+    def process(target):
+        if fail:
+            raise RuntimeError("fora do ar")
+        return {"target": target}
+
+    manager = make_manager(process, max_attempts=1)
+    job_id = manager.submit_job(["A", "", "B"])
+    job = wait_for_job(manager, job_id)
+    assert job["erros"] == 3
+
+    fail = False
+    # Itens sem produto não são reprocessados
+    assert manager.retry_failed(job_id) == 2
+    job = wait_for_job(manager, job_id)
+    assert (job["concluidos"], job["erros"]) == (2, 1)
+    assert manager.retry_failed(job_id) == 0
+    assert manager.retry_failed("inexistente") is None
+
+def test_resume_after_restart(make_manager):
+    manager = make_manager()
+    job_id = manager.submit_job(["A", "B"])
+    wait_for_job(manager, job_id)
+    # Simula uma parada do serviço com um item em processamento e outro com erro
+    with manager.lock:
+        manager.conn.execute(
+            "UPDATE job_items SET status = ?, result = NULL WHERE job_id = ? AND idx = 0", (STATUS_PROCESSANDO, job_id)
+        )
+        manager.conn.execute("UPDATE job_items SET status = ? WHERE job_id = ? AND idx = 1", (STATUS_ERRO, job_id))
+        manager.conn.execute("UPDATE jobs SET status = ? WHERE id = ?", (STATUS_PROCESSANDO, job_id))
+        manager.conn.commit()
+    manager.shutdown()
+
+    calls = []
+
+    def process(target):
+        calls.append(target)
+        return {"target": target}
+
+    restarted = make_manager(process)
+    job = wait_for_job(restarted, job_id)
+    assert calls == ["A"]
+    assert [item["status"] for item in job["items"]] == [STATUS_CONCLUIDO, STATUS_ERRO]
+
+def test_seq_continues_after_restart(make_manager):
+    manager = make_manager()
+    job = wait_for_job(manager, manager.submit_job(["A"]))
+    manager.shutdown()
+
+    restarted = make_manager()
+    other = wait_for_job(restarted, restarted.submit_job(["B"]))
+    assert other["cursor"] > job["cursor"]
+
+def test_old_finished_jobs_are_purged(make_manager):
+    manager = make_manager(retention_days=1)
+    old_job = wait_for_job(manager, manager.submit_job(["A"]))["job_id"]
+    new_job = wait_for_job(manager, manager.submit_job(["B"]))["job_id"]
+    with manager.lock:
+        manager.conn.execute("UPDATE jobs SET updated_at = ? WHERE id = ?", (time.time() - 2 * 86400, old_job))
+        manager.conn.commit()
+
+    assert manager.purge_old_jobs() == 1
+    assert manager.get_job(old_job) is None
+    assert manager.get_job(new_job) is not None
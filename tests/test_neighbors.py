@@ -0,0 +1,55 @@
+import numpy as np
+import pytest
+
+from neighbors import NeighborTable, build_neighbor_table, compute_neighbors
+
+def random_catalog(rng, size, dim=16, prefix="ITEM"):
+    embeddings = rng.standard_normal((size, dim)).astype(np.float32)
+    embeddings /= np.linalg.norm(embeddings, axis=1, keepdims=True)
+    return [f"{prefix} {i}" for i in range(size)], embeddings
+
+def assert_same_table(incremental, full):
+    assert list(incremental.names) == list(full.names)
+    np.testing.assert_array_equal(incremental.neighbors, full.neighbors)
+    np.testing.assert_array_equal(incremental.scores, full.scores)
+
+def test_compute_neighbors_matches_brute_force():
+    rng = np.random.default_rng(0)
+    _, embeddings = random_catalog(rng, 50)
+    rows = np.arange(50)
+    # Orçamento mínimo: um bloco por linha
+    neighbors, scores = compute_neighbors(embeddings, rows, rows, n=5, memory_mb=0)
+
+    similarities = embeddings @ embeddings.T
+    np.fill_diagonal(similarities, -np.inf)
+    expected = np.argsort(-similarities, axis=1, kind="stable")[:, :5]
+    np.testing.assert_array_equal(neighbors, expected)
+    np.testing.assert_allclose(scores, np.take_along_axis(similarities, expected, axis=1), rtol=1e-6)
+
+@pytest.mark.parametrize("seed", [1, 2, 3])
+def test_incremental_update_matches_full_rebuild(seed, tmp_path):
+    rng = np.random.default_rng(seed)
+    names, embeddings = random_catalog(rng, 200)
+    previous = build_neighbor_table(names, embeddings, n=10)
+    path = str(tmp_path / "neighbors.npz")
+    previous.save(path)
+    previous = NeighborTable.load(path)
+
+    # Remove alguns itens e acrescenta outros
+    keep = np.sort(rng.choice(len(names), size=180, replace=False))
+    new_names, new_embeddings = random_catalog(rng, 30, prefix="NOVO")
+    names = [names[i] for i in keep] + new_names
+    embeddings = np.concatenate([embeddings[keep], new_embeddings])
+
+    incremental = build_neighbor_table(names, embeddings, previous, n=10)
+    assert_same_table(incremental, build_neighbor_table(names, embeddings, n=10))
+
+def test_lookup_returns_catalog_name():
+    rng = np.random.default_rng(4)
+    names, embeddings = random_catalog(rng, 20)
+    table = build_neighbor_table(names, embeddings, n=3)
+    item_name, neighbors = table.lookup("  item   7 ")
+    assert item_name == "ITEM 7"
+    assert len(neighbors) == 3
+    assert "ITEM 7" not in [name for name, score in neighbors]
+    assert table.lookup("OUTRO") is None
@@ -173,4 +173,5 @@ def update_products():
     return success
 
 if __name__ == "__main__":
-    update_products() 
\ No newline at end of file
+    import sys
+    sys.exit(0 if update_products() else 1)